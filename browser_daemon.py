@@ -0,0 +1,97 @@
+"""
+Keep one headless Chromium running so the other scripts can share it over CDP.
+
+Start this in its own terminal and leave it running:
+
+    python browser_daemon.py
+
+generate_valid_urls.py and load_files_locally_20260130.py then connect to it
+(each with its own browser context) instead of launching Chromium themselves.
+If the daemon is not running they fall back to launching a private browser.
+
+The age-gate session is cached in STATE_FILE after it is passed, so later runs
+start with the verification cookie already set.
+"""
+
+import json
+import time
+from pathlib import Path
+
+from playwright.sync_api import sync_playwright, Error as PlaywrightError
+
+CDP_PORT = 9222
+CDP_ENDPOINT = f"http://localhost:{CDP_PORT}"
+CDP_CONNECT_TIMEOUT_MS = 5000
+STATE_FILE = Path("doj_state.json")  # Cached storage_state (cookies) from a passed age gate
+BLOCKED_RESOURCE_TYPES = {"image", "font", "stylesheet", "media"}  # Never needed: we only read HTML
+
+
+def connect_or_launch(p):
+    """Connect to the daemon's browser over CDP, or launch a private one if it is not running."""
+    try:
+        return p.chromium.connect_over_cdp(CDP_ENDPOINT, timeout=CDP_CONNECT_TIMEOUT_MS)
+    except PlaywrightError:
+        return p.chromium.launch(headless=True)
+
+
+async def connect_or_launch_async(p):
+    """Async-API counterpart of connect_or_launch()."""
+    try:
+        return await p.chromium.connect_over_cdp(CDP_ENDPOINT, timeout=CDP_CONNECT_TIMEOUT_MS)
+    except PlaywrightError:
+        return await p.chromium.launch(headless=True)
+
+
+def cached_storage_state():
+    """Path to the cached age-gate session, or None if there is none yet (for new_context)."""
+    return str(STATE_FILE) if STATE_FILE.exists() else None
+
+
+def cached_cookies() -> list[dict]:
+    """Cookies from the cached session (same shape as context.cookies()), or [] if there is none yet."""
+    if not STATE_FILE.exists():
+        return []
+    return json.loads(STATE_FILE.read_text(encoding="utf-8")).get("cookies", [])
+
+
+def cached_session_is_usable() -> bool:
+    """True if a cached session exists and none of its cookies has expired."""
+    if not STATE_FILE.exists():
+        return False
+    now = time.time()
+    # Session cookies are stored with expires == -1
+    return not any(0 < c.get("expires", -1) < now for c in cached_cookies())
+
+
+def _route_unless_heavy(route):
+    # Returned, not awaited, so the same handler works with the sync and async APIs
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return route.abort()
+    return route.continue_()
+
+
+def block_heavy_resources(context):
+    """Abort image/font/CSS/media requests for every page in the context."""
+    return context.route("**/*", _route_unless_heavy)
+
+
+def main():
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True, args=[f"--remote-debugging-port={CDP_PORT}"])
+        print(f"[*] Browser listening on {CDP_ENDPOINT} (Ctrl+C to stop)")
+        # Idle on a page: wait_for_timeout dispatches Playwright events (time.sleep would not), so
+        # is_connected() turns False as soon as Chromium exits instead of the daemon hanging forever.
+        idle_page = browser.new_page()
+        try:
+            while browser.is_connected():
+                idle_page.wait_for_timeout(1000)
+        except PlaywrightError:
+            pass  # The page went away with the browser
+        except KeyboardInterrupt:
+            browser.close()
+            return
+        print("[!] Browser exited")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Small URL/PDF helpers shared by the DOJ scripts.
+"""
+
+import os
+import re
+
+AGE_QUESTION_TEXT = "Are you 18 years of age or older?"
+PAGER_LAST_SEL = "li.pager__item--last a[href]"  # Only this link reliably carries the last ?page=N
+PAGER_NEXT_SEL = "li.pager__item--next a[href]"
+PDF_ANCHOR_SEL = "a[href$='.pdf' i], a[href$='.ppdf' i]"  # Case-insensitive: also .PDF / .PPDF
+LISTING_READY_SEL = f"li.pager__item--next, {PDF_ANCHOR_SEL}"  # Pager or PDF links = listing rendered
+PAGE_NUM_RE = re.compile(r"[?&]page=(\d+)")
+# One user agent for the browser contexts and the httpx client, so the age-gate session is reused as-is
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+def url_filename(u: str) -> str:
+    # Last path segment, without query/fragment (plain string ops; no full URL parse).
+    name = u.split("?", 1)[0].split("#", 1)[0].rsplit("/", 1)[-1]
+    return name or "download.pdf"
+
+
+def page_urls_from_pager(base_url: str, last_hrefs: list[str]) -> list[str]:
+    # Every page URL of a dataset, from the pager's "Last" link hrefs (PAGER_LAST_SEL). Other pager links
+    # (Next, a windowed 1..5) don't bound the page count, so without a Last link this returns [] and the
+    # caller must walk the pages instead. ?page=0 is the base URL itself.
+    base = base_url.rstrip("/")
+    page_nums = []
+    for href in last_hrefs:
+        # Only this dataset's links (the pager never points elsewhere, but be safe)
+        if base not in href:
+            continue
+        m = PAGE_NUM_RE.search(href)
+        if m:
+            page_nums.append(int(m.group(1)))
+    if not page_nums:
+        return []
+    return [base_url] + [f"{base}?page={n}" for n in range(1, max(page_nums) + 1)]
+
+
+def looks_like_pdf_bytes(b: bytes) -> bool:
+    return b[:4] == b"%PDF"
+
+
+def preallocate(f, content_length: str | None) -> None:
+    # Reserve the whole file in one go when the size is known, so the filesystem
+    # doesn't grow it chunk by chunk. POSIX only; a no-op on Windows.
+    if not content_length or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        size = int(content_length)
+    except ValueError:
+        return
+    if size > 0:
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            pass  # Filesystem without fallocate support; just grow the file normally
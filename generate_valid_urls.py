@@ -5,9 +5,13 @@ Does NOT download any PDFs. Run this first, then use load_files_locally for PDFs
 Works around age-verification / bot blocker:
 1. Uses a real-looking browser (viewport, user-agent).
 2. Waits for and clicks through the age gate so the session is verified.
-3. Does NOT request ?page=N directly (site blocks that). Instead we discover
-   valid URLs by clicking the "Next" link on each page and recording the URL
-   we land on (same as a human). Stops when there is no Next link.
+3. Reads the pager's "Last" link on the first page of each dataset and
+   enumerates ?page=1..last. These pages are then requested as ?page=N
+   directly, but only inside the browser session that passed the age gate;
+   the site may still reject them outside that session. If there is no Last
+   link (no pager, or a mini pager with only Next), we fall back to clicking
+   the "Next" link on each page and recording the URL we land on (same as a
+   human), stopping when there is no Next link.
 """
 
 import time
@@ -15,6 +19,9 @@ from pathlib import Path
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 
+from browser_daemon import STATE_FILE, block_heavy_resources, cached_storage_state, connect_or_launch
+from doj_utils import AGE_QUESTION_TEXT, LISTING_READY_SEL, PAGER_LAST_SEL, USER_AGENT, page_urls_from_pager
+
 DATASET_PAGES = [
     "https://www.justice.gov/epstein/doj-disclosures/data-set-9-files",
     "https://www.justice.gov/epstein/doj-disclosures/data-set-10-files",
@@ -23,19 +30,46 @@ DATASET_PAGES = [
 
 VALID_URLS_OUTPUT = Path("valid_page_urls.txt")
 
-USER_AGENT = (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
-    "Chrome/120.0.0.0 Safari/537.36"
-)
 VIEWPORT = {"width": 1920, "height": 1080}
-AGE_GATE_WAIT_MS = 4000
-NEXT_CLICK_DELAY_MS = 1200  # Delay between clicking Next (human-like)
+AGE_GATE_HIDE_TIMEOUT_MS = 5000  # How long the question may linger after clicking Yes
+LISTING_READY_TIMEOUT_MS = 10000
+NEXT_MAX_RETRIES = 4  # Reloads of a page answered with 429 / 5xx before giving up
+NEXT_BACKOFF_BASE_S = 1.0  # Doubles on each retry (or Retry-After, if longer)
+
+
+def wait_for_listing(page) -> bool:
+    """Wait until the listing markup (pager or PDF links) is attached. Returns False on timeout.
+
+    Used instead of networkidle, which stalls on the site's long-poll/analytics requests.
+    """
+    try:
+        page.locator(LISTING_READY_SEL).first.wait_for(state="attached", timeout=LISTING_READY_TIMEOUT_MS)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+def wait_for_page_ready(page) -> bool:
+    """After domcontentloaded: wait until either the listing or the age gate is attached. Returns False on timeout.
+
+    Either may be injected by scripts after the DOM is parsed, so neither can be checked right away.
+    """
+    ready = page.locator(LISTING_READY_SEL).or_(page.get_by_text(AGE_QUESTION_TEXT))
+    try:
+        ready.first.wait_for(state="attached", timeout=LISTING_READY_TIMEOUT_MS)
+        return True
+    except PlaywrightTimeoutError:
+        return False
 
 
 def pass_age_gate_if_present(page) -> bool:
     """Wait for age gate, click Yes, wait for session. Returns True if we clicked."""
+    wait_for_page_ready(page)
+    age_question = page.get_by_text(AGE_QUESTION_TEXT)
+    # Session already verified (cached state or an earlier dataset): don't wait out the timeout below
+    if age_question.count() == 0:
+        return False
     try:
-        age_question = page.locator("text=Are you 18 years of age or older?")
         age_question.wait_for(state="visible", timeout=15000)
     except Exception:
         return False
@@ -47,15 +81,41 @@ def pass_age_gate_if_present(page) -> bool:
                 break
         else:
             return False
-        page.wait_for_load_state("networkidle", timeout=30000)
-        time.sleep(AGE_GATE_WAIT_MS / 1000.0)
+        # Wait for the gate to actually go away rather than a fixed pause
+        age_question.wait_for(state="hidden", timeout=AGE_GATE_HIDE_TIMEOUT_MS)
+        wait_for_listing(page)
         return True
     except Exception:
         return False
 
 
+def pager_page_urls(page, base_url: str) -> list[str]:
+    """All page URLs for this dataset, read from the pager's Last link. Empty if there is none (walk Next instead)."""
+    hrefs = page.eval_on_selector_all(PAGER_LAST_SEL, "els => els.map(e => e.href)")
+    return page_urls_from_pager(base_url, hrefs)
+
+
+def is_throttled(response) -> bool:
+    return response is not None and (response.status == 429 or response.status >= 500)
+
+
+def reload_with_backoff(page, response):
+    """Reload the current page with exponential backoff while the server answers 429 / 5xx. Returns the last response."""
+    for attempt in range(NEXT_MAX_RETRIES):
+        if not is_throttled(response):
+            break
+        delay = NEXT_BACKOFF_BASE_S * 2 ** attempt
+        retry_after = response.headers.get("retry-after", "")
+        if retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        print(f"   - HTTP {response.status}, retrying in {delay:.0f}s")
+        time.sleep(delay)
+        response = page.reload(wait_until="domcontentloaded", timeout=60000)
+    return response
+
+
 def click_next(page, base_url: str) -> bool:
-    """Click the paginator Next link for this dataset. Returns True if we navigated."""
+    """Click the paginator Next link for this dataset. Returns True if we navigated (and weren't throttled out)."""
     base_path = base_url.rstrip("/").split("/")[-1]  # e.g. "data-set-10-files"
     # Next can be: same path in href, or relative ?page=N (stays on same dataset)
     selectors = [
@@ -76,8 +136,13 @@ def click_next(page, base_url: str) -> bool:
             if "data-set-" in href and base_path not in href:
                 continue
             try:
-                with page.expect_navigation(wait_until="networkidle", timeout=45000):
+                with page.expect_navigation(wait_until="domcontentloaded", timeout=45000) as nav:
                     loc.click()
+                response = reload_with_backoff(page, nav.value)
+                if is_throttled(response):
+                    print(f"   - Still HTTP {response.status} after {NEXT_MAX_RETRIES} retries, stopping dataset")
+                    return False
+                wait_for_listing(page)
                 return True
             except PlaywrightTimeoutError:
                 time.sleep(1)
@@ -89,13 +154,15 @@ def click_next(page, base_url: str) -> bool:
 
 def main():
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
+        browser = connect_or_launch(p)
         context = browser.new_context(
+            storage_state=cached_storage_state(),
             viewport=VIEWPORT,
             user_agent=USER_AGENT,
             locale="en-US",
             java_script_enabled=True,
         )
+        block_heavy_resources(context)
         page = context.new_page()
 
         valid_page_urls: list[str] = []
@@ -103,7 +170,7 @@ def main():
         for base_url in DATASET_PAGES:
             print(f"\n[*] Discovering pages for: {base_url}")
             try:
-                response = page.goto(base_url, wait_until="networkidle", timeout=60000)
+                response = page.goto(base_url, wait_until="domcontentloaded", timeout=60000)
             except PlaywrightTimeoutError:
                 print("   - Base URL timeout, skipping dataset")
                 continue
@@ -113,10 +180,18 @@ def main():
                 continue
             if pass_age_gate_if_present(page):
                 print("   - Age verification passed")
+                context.storage_state(path=STATE_FILE)
             else:
                 print("   - No age gate found (or already passed)")
 
-            # Walk pagination by clicking Next (same dataset only); record each page URL
+            # Pager with a Last link: it gives every page URL without visiting them
+            pager_urls = pager_page_urls(page, base_url)
+            if pager_urls:
+                valid_page_urls.extend(pager_urls)
+                print(f"   - pager lists {len(pager_urls)} pages: {pager_urls[0]} .. {pager_urls[-1]}")
+                continue
+
+            # Fallback: walk pagination by clicking Next (same dataset only); record each page URL
             seen = set()
             while True:
                 url = page.url
@@ -128,7 +203,6 @@ def main():
                 seen.add(url)
                 valid_page_urls.append(url)
                 print(f"   - valid: {url}")
-                time.sleep(NEXT_CLICK_DELAY_MS / 1000.0)
                 if not click_next(page, base_url):
                     break
 
@@ -1,8 +1,21 @@
+import asyncio
 import os
+import sys
 from pathlib import Path
-from urllib.parse import urlparse
 
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+import httpx
+from tqdm import tqdm
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+
+from browser_daemon import (
+    STATE_FILE,
+    block_heavy_resources,
+    cached_cookies,
+    cached_session_is_usable,
+    cached_storage_state,
+    connect_or_launch_async,
+)
+from doj_utils import AGE_QUESTION_TEXT, LISTING_READY_SEL, PAGER_LAST_SEL, PAGER_NEXT_SEL, USER_AGENT, looks_like_pdf_bytes, page_urls_from_pager, preallocate, url_filename
 
 DATASET_PAGES = [
     "https://www.justice.gov/epstein/doj-disclosures/data-set-9-files",
@@ -10,69 +23,287 @@ DATASET_PAGES = [
     "https://www.justice.gov/epstein/doj-disclosures/data-set-11-files",
 ]
 
-MAX_PAGE = 1000  # Test ?page=1 through ?page=1000 for each dataset
 OUT_DIR = Path("doj_epstein_datasets_9_10_11_pdfs")
 VALID_URLS_OUTPUT = Path("valid_page_urls.txt")  # Final list of valid URLs
+PDF_URLS_OUTPUT = Path("pdf_urls.txt")  # Unique PDF URLs; only written when every listing page was collected
+PDF_URLS_PART = PDF_URLS_OUTPUT.with_suffix(PDF_URLS_OUTPUT.suffix + ".part")  # In-progress or incomplete list
+# Runs in the page: every PDF link (anchors, plus absolute URLs anywhere in the HTML). Both sources go
+# through the same canonical form (absolute, no query/fragment, .ppdf typos fixed) before the Set dedupes
+# them, so one file never shows up twice; one round trip returns the final list.
+COLLECT_PDFS_JS = r"""() => {
+    const out = new Set();
+    const add = (raw) => {
+        let u;
+        try {
+            u = new URL(raw, document.baseURI);
+        } catch (e) {
+            return;  // Malformed match in the HTML text
+        }
+        u.search = "";
+        u.hash = "";
+        u.pathname = u.pathname.replace(/\.ppdf$/i, ".pdf");
+        if (/\.pdf$/i.test(u.pathname)) out.add(u.href);
+    };
+    for (const a of document.querySelectorAll("a[href]")) add(a.href);
+    for (const m of document.documentElement.outerHTML.matchAll(/https?:\/\/[^\s"'<>]+?\.p?pdf\b/gi)) add(m[0]);
+    return [...out];
+}"""
+LISTING_READY_TIMEOUT_MS = 10000
+DISCOVERY_TABS = 6  # Listing pages loaded concurrently while collecting PDF links
+DOWNLOAD_WORKERS = 8  # Concurrent PDF downloads
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+DOWNLOAD_WRITE_BUFFER = 1 << 20
+DOWNLOAD_TIMEOUT_S = 120
+PDF_CONTENT_TYPES = ("application/pdf", "application/x-pdf")
+MIN_PDF_BYTES = 100  # Anything smaller is an error stub, not a real PDF
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-def url_filename(u: str) -> str:
-    name = os.path.basename(urlparse(u).path)
-    return name or "download.pdf"
-
-def normalize_pdf_url(u: str) -> str:
-    # DOJ pages sometimes contain .ppdf typos; fix them.
-    if u.lower().endswith(".ppdf"):
-        return u[:-5] + ".pdf"
-    return u
-
-def looks_like_pdf_bytes(b: bytes) -> bool:
-    return b[:4] == b"%PDF"
-
-def collect_pdfs_from_current_page(page) -> set[str]:
-    pdfs = set()
-    anchors = page.locator("a[href$='.pdf'], a[href$='.PDF'], a[href$='.ppdf'], a[href$='.PPDF']")
-    for i in range(anchors.count()):
-        href = anchors.nth(i).get_attribute("href")
-        if href:
-            # make absolute
-            abs_url = page.url
-            full = page.evaluate(
-                """([base, href]) => new URL(href, base).toString()""",
-                [abs_url, href],
-            )
-            pdfs.add(normalize_pdf_url(full))
-    return pdfs
-
-def click_age_yes_if_present(page):
+async def collect_pdfs_from_current_page(page) -> set[str]:
+    return set(await page.evaluate(COLLECT_PDFS_JS))
+
+async def wait_for_listing(page):
+    # Wait for the listing markup instead of networkidle (the site keeps long-poll/analytics requests open).
+    try:
+        await page.locator(LISTING_READY_SEL).first.wait_for(state="attached", timeout=LISTING_READY_TIMEOUT_MS)
+    except PlaywrightTimeoutError:
+        pass
+
+async def wait_for_page_ready(page):
+    # After domcontentloaded, wait until either the listing or the age gate is attached: scripts may inject
+    # both after the DOM is parsed, so reading the page right away can miss PDFs or the gate.
+    ready = page.locator(LISTING_READY_SEL).or_(page.get_by_text(AGE_QUESTION_TEXT))
+    try:
+        await ready.first.wait_for(state="attached", timeout=LISTING_READY_TIMEOUT_MS)
+    except PlaywrightTimeoutError:
+        pass
+
+async def click_age_yes_if_present(page) -> bool:
     # The DOJ site shows "Are you 18 years of age or older? Yes No" on these pages. :contentReference[oaicite:2]{index=2}
+    # Returns True if we clicked Yes.
+    await wait_for_page_ready(page)
     try:
-        if page.locator("text=Are you 18 years of age or older?").count() > 0:
+        if await page.get_by_text(AGE_QUESTION_TEXT).count() > 0:
             yes = page.locator("a:has-text('Yes'), button:has-text('Yes')").first
-            if yes.count() > 0:
-                yes.click()
-                page.wait_for_load_state("networkidle", timeout=30000)
+            if await yes.count() > 0:
+                await yes.click()
+                await wait_for_listing(page)
+                return True
     except PlaywrightTimeoutError:
         pass
+    return False
+
+async def collect_pdfs_worker(context, queue: asyncio.Queue, all_pdf_urls: set[str]) -> int:
+    # One tab per worker; keep taking listing pages off the queue until it is empty.
+    # Returns the number of listing pages that failed to load.
+    failed = 0
+    page = await context.new_page()
+    while True:
+        try:
+            url = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+        try:
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+            if not response or not response.ok:
+                status = response.status if response else "fail"
+                print(f"   - {url} -> invalid (status {status})")
+                failed += 1
+                continue
+            await wait_for_page_ready(page)
+            pdfs = await collect_pdfs_from_current_page(page)
+        except PlaywrightTimeoutError:
+            print(f"   - {url} -> timeout")
+            failed += 1
+            continue
+        except PlaywrightError as e:
+            # net::ERR_*, or the page navigated away mid-evaluate: lose this page, not every tab
+            print(f"   - {url} -> {e.message.splitlines()[0]}")
+            failed += 1
+            continue
+        all_pdf_urls |= pdfs
+    await page.close()
+    return failed
 
-def main():
-    # Step 2: If valid_page_urls.txt exists, use it and only do PDF collection/download (no URL discovery).
-    if VALID_URLS_OUTPUT.exists():
-        valid_page_urls = [u.strip() for u in VALID_URLS_OUTPUT.read_text(encoding="utf-8").splitlines() if u.strip()]
-        print(f"[*] Using {len(valid_page_urls)} valid page URLs from {VALID_URLS_OUTPUT}")
+async def collect_all_pdfs(context, valid_page_urls: list[str]) -> int:
+    # Writes unique PDF URLs to PDF_URLS_PART and returns how many there are. The list is promoted to
+    # PDF_URLS_OUTPUT (which lets later runs skip the browser) only if every listing page was collected;
+    # otherwise it stays a .part file and the next run collects again.
+    queue: asyncio.Queue = asyncio.Queue()
+    for url in valid_page_urls:
+        queue.put_nowait(url)
+    all_pdf_urls: set[str] = set()
+    failed = sum(await asyncio.gather(*[collect_pdfs_worker(context, queue, all_pdf_urls) for _ in range(DISCOVERY_TABS)]))
+    if not all_pdf_urls:
+        return 0
+    # Sorted for a stable file (and download) order across runs; tabs finish in any order
+    PDF_URLS_PART.write_text("".join(u + "\n" for u in sorted(all_pdf_urls)), encoding="utf-8")
+    if failed:
+        print(f"[!] {failed} listing page(s) failed; PDF list is incomplete (kept as {PDF_URLS_PART}, re-run to retry)")
     else:
-        valid_page_urls = []
+        os.replace(PDF_URLS_PART, PDF_URLS_OUTPUT)
+    return len(all_pdf_urls)
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
+def existing_pdf_names() -> set[str]:
+    # One directory scan instead of an exists()/stat() pair per URL.
+    with os.scandir(OUT_DIR) as entries:
+        return {e.name for e in entries if e.is_file() and e.stat().st_size > 0}
+
+def read_pdf_urls():
+    # The complete list if there is one, else this run's incomplete one
+    path = PDF_URLS_OUTPUT if PDF_URLS_OUTPUT.exists() else PDF_URLS_PART
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            u = line.strip()
+            if u:
+                yield u
+
+def head_says_pdf(resp: httpx.Response) -> bool:
+    if resp.status_code in (405, 501):
+        return True  # Server doesn't do HEAD; let the GET decide
+    if not resp.is_success:
+        return False
+    ctype = resp.headers.get("content-type", "").lower()
+    length = resp.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) <= MIN_PDF_BYTES:
+        return False
+    return ctype.startswith(PDF_CONTENT_TYPES)
+
+async def download_pdf(client: httpx.AsyncClient, u: str) -> bool:
+    fname = url_filename(u)
+    out_path = OUT_DIR / fname
+    tmp = out_path.with_suffix(out_path.suffix + ".part")
+    try:
+        # Cheap HEAD first, so broken links and HTML error pages are never downloaded in full
+        head = await client.head(u)
+        if not head_says_pdf(head):
+            ctype = head.headers.get("content-type", "")
+            tqdm.write(f"[!] Skipped {fname} (HEAD: HTTP {head.status_code}, content-type: {ctype})", file=sys.stderr)
+            return False
+
+        async with client.stream("GET", u) as resp:
+            if not resp.is_success:
+                tqdm.write(f"[!] HTTP {resp.status_code} for {u}", file=sys.stderr)
+                return False
+
+            chunks = resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE)
+            # Check the magic bytes on the first chunk, so non-PDF bodies never touch the disk.
+            first = await anext(chunks, b"")
+            if not looks_like_pdf_bytes(first):
+                # Sometimes HTML slips through if access fails
+                ctype = resp.headers.get("content-type", "")
+                tqdm.write(f"[!] Not a PDF for {fname} (content-type: {ctype})", file=sys.stderr)
+                return False
+
+            # Stream to the .part file so only one chunk per download is held in memory.
+            with open(tmp, "wb", buffering=DOWNLOAD_WRITE_BUFFER) as f:
+                # Content-Length is the encoded size, so only trust it for unencoded bodies
+                if "content-encoding" not in resp.headers:
+                    preallocate(f, resp.headers.get("content-length"))
+                f.write(first)
+                async for chunk in chunks:
+                    f.write(chunk)
+                f.truncate()  # Drop any preallocated tail the body didn't fill
+        os.replace(tmp, out_path)  # Atomic; no fsync (a re-run repairs anything lost)
+    except httpx.HTTPError as e:
+        tqdm.write(f"[!] Request failed for {u}: {e}", file=sys.stderr)
+        tmp.unlink(missing_ok=True)
+        return False
+    except OSError as e:
+        # Disk full, permissions, ...: lose this file, not every download in flight
+        tqdm.write(f"[!] Could not save {fname}: {e}", file=sys.stderr)
+        tmp.unlink(missing_ok=True)
+        return False
+    return True
+
+async def download_pdfs(pdf_urls, cookies: list[dict]) -> int:
+    # Download over plain HTTP/2 with the browser session's cookies, so the age gate stays passed
+    # (avoiding the WAF issue) without routing PDF bytes through Chromium.
+    jar = httpx.Cookies()
+    for c in cookies:
+        jar.set(c["name"], c["value"], domain=c["domain"], path=c["path"])
+    sem = asyncio.Semaphore(DOWNLOAD_WORKERS)
+
+    async with httpx.AsyncClient(
+        http2=True,
+        headers={"User-Agent": USER_AGENT},
+        cookies=jar,
+        follow_redirects=True,
+        timeout=DOWNLOAD_TIMEOUT_S,
+        limits=httpx.Limits(max_keepalive_connections=16),
+    ) as client:
+
+        async def download(u: str) -> bool:
+            async with sem:
+                return await download_pdf(client, u)
+
+        # One progress bar update per finished file instead of a print per file
+        tasks = [asyncio.ensure_future(download(u)) for u in pdf_urls]
+        ok = 0
+        for done in tqdm(asyncio.as_completed(tasks), total=len(tasks), unit="pdf", desc="[DL] Downloading", ascii=True):
+            ok += await done
+    return ok
+
+async def refresh_session() -> bool:
+    # Pass the age gate in a fresh context and save the session to STATE_FILE. Used when the PDF list
+    # is already complete but the cached cookies are missing or expired. Returns False if no dataset loaded.
+    saved = False
+    async with async_playwright() as p:
+        browser = await connect_or_launch_async(p)
+        context = await browser.new_context(user_agent=USER_AGENT)
+        await block_heavy_resources(context)
+        page = await context.new_page()
+        for base_url in DATASET_PAGES:
+            try:
+                response = await page.goto(base_url, wait_until="domcontentloaded", timeout=60000)
+            except PlaywrightTimeoutError:
+                continue
+            if response and response.ok:
+                await click_age_yes_if_present(page)
+                await context.storage_state(path=STATE_FILE)
+                saved = True
+                break
+        await browser.close()
+    return saved
+
+async def walk_pager_next(page, base_url: str) -> tuple[list[str], bool]:
+    # No "Last" link to read the page count from: follow the Next links from the base page instead.
+    # Returns (page URLs, complete); complete is False if a page failed before the last one was reached.
+    base = base_url.rstrip("/")
+    urls = [base_url]
+    while True:
+        hrefs = await page.eval_on_selector_all(PAGER_NEXT_SEL, "els => els.map(e => e.href)")
+        # Stay on this dataset; stop at the end or if the pager loops back
+        next_url = next((h for h in hrefs if base in h), None)
+        if not next_url or next_url in urls:
+            return urls, True
+        try:
+            response = await page.goto(next_url, wait_until="domcontentloaded", timeout=60000)
+        except PlaywrightError as e:
+            print(f"   - {next_url} -> {e.message.splitlines()[0]}; page list for this dataset is incomplete")
+            return urls, False
+        if not response or not response.ok:
+            status = response.status if response else "fail"
+            print(f"   - {next_url} -> invalid (status {status}); page list for this dataset is incomplete")
+            return urls, False
+        await wait_for_page_ready(page)
+        urls.append(next_url)
+
+async def collect_with_browser(valid_page_urls: list[str]) -> int:
+    # Phases 1-2 in the browser. Returns the number of PDF URLs written to PDF_URLS_OUTPUT (0 = nothing to do).
+    async with async_playwright() as p:
+        browser = await connect_or_launch_async(p)
+        context = await browser.new_context(storage_state=cached_storage_state(), user_agent=USER_AGENT)
+        await block_heavy_resources(context)
+        page = await context.new_page()
 
         if not valid_page_urls:
-            # Phase 1: Discover valid URLs (?page=1..MAX_PAGE per dataset), then continue to Phase 2.
+            # Phase 1: Discover valid URLs from each dataset's pager (one visit per dataset when it has a Last
+            # link, otherwise a walk over its Next links), then continue to Phase 2.
+            complete = True
             for base_url in DATASET_PAGES:
-                print(f"\n[*] Testing URLs for: {base_url}")
+                print(f"\n[*] Reading pager for: {base_url}")
                 try:
-                    response = page.goto(base_url, wait_until="networkidle", timeout=60000)
+                    response = await page.goto(base_url, wait_until="domcontentloaded", timeout=60000)
                 except PlaywrightTimeoutError:
                     print("   - Base URL timeout, skipping dataset")
                     continue
@@ -80,84 +311,93 @@ def main():
                     status = response.status if response else "fail"
                     print(f"   - Base URL invalid (status {status}), skipping dataset")
                     continue
-                click_age_yes_if_present(page)
-
-                for page_num in range(1, MAX_PAGE + 1):
-                    url = f"{base_url}?page={page_num}"
-                    try:
-                        response = page.goto(url, wait_until="networkidle", timeout=60000)
-                    except PlaywrightTimeoutError:
-                        print(f"   - {url} -> timeout (stopping this dataset)")
-                        break
-                    if not response or not response.ok:
-                        status = response.status if response else "fail"
-                        print(f"   - {url} -> invalid (status {status}), stopping at page {page_num - 1}")
-                        break
-                    valid_page_urls.append(url)
-                    if page_num <= 5 or page_num % 50 == 0 or page_num == MAX_PAGE:
-                        print(f"   - valid: {url}")
+                if await click_age_yes_if_present(page):
+                    await context.storage_state(path=STATE_FILE)
+
+                hrefs = await page.eval_on_selector_all(PAGER_LAST_SEL, "els => els.map(e => e.href)")
+                urls = page_urls_from_pager(base_url, hrefs)
+                if urls:
+                    print(f"   - Last link: {len(urls)} pages: {urls[0]} .. {urls[-1]}")
+                else:
+                    # No Last link (no pager, or Next only): the page count is unknown, so walk it
+                    urls, dataset_complete = await walk_pager_next(page, base_url)
+                    complete = complete and dataset_complete
+                    print(f"   - Followed Next links: {len(urls)} pages: {urls[0]} .. {urls[-1]}")
+                valid_page_urls.extend(urls)
 
             valid_page_urls.sort()
-            VALID_URLS_OUTPUT.write_text("\n".join(valid_page_urls), encoding="utf-8")
             print(f"\n[*] Total valid page URLs: {len(valid_page_urls)}")
-            print(f"[Saved] Valid URLs written to: {VALID_URLS_OUTPUT.resolve()}")
+            if complete:
+                VALID_URLS_OUTPUT.write_text("\n".join(valid_page_urls), encoding="utf-8")
+                print(f"[Saved] Valid URLs written to: {VALID_URLS_OUTPUT.resolve()}")
+            else:
+                # Don't persist a short list as authoritative; the next run discovers again
+                print(f"[!] Page list is incomplete; not saving {VALID_URLS_OUTPUT}")
 
         if not valid_page_urls:
             print("No valid page URLs found.")
-            browser.close()
-            return
+            await browser.close()
+            return 0
 
-        # Phase 2: Collect PDFs from each valid page URL, then download.
-        all_pdf_urls: set[str] = set()
-        for url in valid_page_urls:
-            try:
-                response = page.goto(url, wait_until="networkidle", timeout=60000)
-            except PlaywrightTimeoutError:
-                continue
-            if not response or not response.ok:
-                continue
-            pdfs = collect_pdfs_from_current_page(page)
-            all_pdf_urls |= pdfs
+        # Phase 2: Collect PDFs from each valid page URL (several tabs at once).
+        pdf_count = await collect_all_pdfs(context, valid_page_urls)
 
-        print(f"\n[*] Total unique PDFs found: {len(all_pdf_urls)}")
-        if not all_pdf_urls:
+        print(f"\n[*] Total unique PDFs found: {pdf_count}")
+        if not pdf_count:
             print("No PDFs found. DOJ may have changed markup.")
-            browser.close()
-            return
-
-        # Download using the same browser session (cookies/headers), avoiding the WAF issue.
-        ok = 0
-        for u in sorted(all_pdf_urls):
-            fname = url_filename(u)
-            out_path = OUT_DIR / fname
-
-            if out_path.exists() and out_path.stat().st_size > 0:
-                print(f"[OK] Exists: {fname}")
-                ok += 1
-                continue
+            await browser.close()
+            return 0
+        if PDF_URLS_OUTPUT.exists():
+            print(f"[Saved] PDF URLs written to: {PDF_URLS_OUTPUT.resolve()}")
 
-            resp = context.request.get(u, timeout=120000)
-            if not resp.ok:
-                print(f"[!] HTTP {resp.status} for {u}")
-                continue
+        # Persist the session for the HTTP client (and later runs); the download phase does not need the browser.
+        await context.storage_state(path=STATE_FILE)
+        await browser.close()
+    return pdf_count
 
-            data = resp.body()
-            if not looks_like_pdf_bytes(data):
-                # Sometimes HTML slips through if access fails
-                ctype = resp.headers.get("content-type", "")
-                print(f"[!] Not a PDF for {fname} (content-type: {ctype})")
-                continue
+async def main():
+    # Step 3: If pdf_urls.txt exists, a previous run already collected every PDF URL: skip the browser entirely.
+    if PDF_URLS_OUTPUT.exists():
+        pdf_count = sum(1 for _ in read_pdf_urls())
+        print(f"[*] Using {pdf_count} PDF URLs from {PDF_URLS_OUTPUT} (delete it to re-collect)")
+        # Without valid age-gate cookies every request would just come back 401/403
+        if not cached_session_is_usable():
+            print(f"[*] No usable session in {STATE_FILE} (missing or expired); passing the age gate first")
+            if not await refresh_session():
+                print("[!] Could not load any dataset page to pass the age gate; not downloading.")
+                return
+    else:
+        # Step 2: If valid_page_urls.txt exists, use it and only do PDF collection/download (no URL discovery).
+        if VALID_URLS_OUTPUT.exists():
+            valid_page_urls = [u.strip() for u in VALID_URLS_OUTPUT.read_text(encoding="utf-8").splitlines() if u.strip()]
+            print(f"[*] Using {len(valid_page_urls)} valid page URLs from {VALID_URLS_OUTPUT}")
+        else:
+            valid_page_urls = []
+        pdf_count = await collect_with_browser(valid_page_urls)
+        if not pdf_count:
+            return
 
-            tmp = out_path.with_suffix(out_path.suffix + ".part")
-            tmp.write_bytes(data)
-            tmp.replace(out_path)
+    # Age-gate cookies for the HTTP client, from the session saved by this or an earlier run.
+    cookies = cached_cookies()
+    existing = existing_pdf_names()
+    # One URL per filename (first one wins): concurrent downloads of the same name would share a .part file.
+    by_name: dict[str, str] = {}
+    for u in read_pdf_urls():
+        by_name.setdefault(url_filename(u), u)
+    to_download = [u for name, u in by_name.items() if name not in existing]
+    already = len(by_name) - len(to_download)
+    if len(by_name) < pdf_count:
+        print(f"[*] {pdf_count - len(by_name)} PDF URLs share a filename with another; downloading one each")
+    print(f"[OK] Already downloaded: {already}, to download: {len(to_download)}")
 
-            print(f"[DL] Downloaded: {fname}")
-            ok += 1
+    # Progress and per-file warnings go to stderr (the bar's stream, via tqdm.write); stdout is quiet
+    # until the summary, so it doesn't need flushing on every line.
+    sys.stdout.flush()
+    sys.stdout.reconfigure(line_buffering=False)
 
-        print(f"\n[Done] Downloaded (or already existed): {ok}/{len(all_pdf_urls)}")
-        print(f"Saved to: {OUT_DIR.resolve()}")
-        browser.close()
+    ok = already + await download_pdfs(to_download, cookies)
+    print(f"\n[Done] Downloaded (or already existed): {ok}/{len(by_name)}")
+    print(f"Saved to: {OUT_DIR.resolve()}")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())